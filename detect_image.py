@@ -1,9 +1,10 @@
-from ultralytics import YOLO
 import cv2
 import os
+from model_utils import load_model
 
-# Load model
-model = YOLO("best.pt")
+# Load model — prefer the TensorRT engine (run export_engine.py once to build it)
+MODEL_PATH = "best.engine" if os.path.exists("best.engine") else "best.pt"
+model, predict_kwargs = load_model(MODEL_PATH)
 
 # Image path
 IMAGE_PATH = "test.jpg"
@@ -15,7 +16,8 @@ results = model.predict(
     source=IMAGE_PATH,
     conf=0.25,
     imgsz=960,
-    save=False
+    save=False,
+    **predict_kwargs
 )
 
 # Get annotated image
@@ -5,16 +5,17 @@ Usage:
   python detect_video.py vid1.mp4 vid2.mp4      # process multiple videos
   python detect_video.py --conf 0.15 vid1.mp4   # custom confidence
 """
-import sys, argparse
-from ultralytics import YOLO
+import sys, os, argparse
+from model_utils import load_model
 
-MODEL_PATH = "m1.pt"
+# Prefer the TensorRT engine (run export_engine.py once to build it)
+MODEL_PATH = "m1.engine" if os.path.exists("m1.engine") else "m1.pt"
 
 def parse_args():
     parser = argparse.ArgumentParser(description="IRIS Accident Detector — Video")
     parser.add_argument("videos", nargs="*", default=["test1.mp4"],
                         help="One or more video file paths to process")
-    parser.add_argument("--model", default=MODEL_PATH, help="YOLO model weights (.pt)")
+    parser.add_argument("--model", default=MODEL_PATH, help="YOLO model weights (.pt or .engine)")
     parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold (default: 0.25)")
     parser.add_argument("--iou",  type=float, default=0.5,  help="IoU threshold (default: 0.5)")
     parser.add_argument("--imgsz", type=int, default=960,   help="Inference image size (default: 960)")
@@ -22,7 +23,7 @@ def parse_args():
 
 def main():
     args = parse_args()
-    model = YOLO(args.model)
+    model, predict_kwargs = load_model(args.model)
     print(f"\n{'='*55}")
     print(f"  IRIS Accident Detection  |  Model: {args.model}")
     print(f"  Videos to process: {len(args.videos)}")
@@ -38,7 +39,8 @@ def main():
                 iou=args.iou,
                 imgsz=args.imgsz,
                 save=True,
-                verbose=True
+                verbose=True,
+                **predict_kwargs
             )
             total_detections = sum(len(r.boxes) for r in results if r.boxes is not None)
             print(f"  ✅ Done — {total_detections} total detections across all frames\n")
@@ -6,21 +6,85 @@ Usage:
   python detect_video_live.py --conf 0.10 vid1.mp4  # custom confidence
 Press Q to skip to next video / quit.
 """
-import cv2, time, argparse, os, requests
-from ultralytics import YOLO
+import cv2, time, argparse, os, requests, threading, queue
+from model_utils import load_model
 
 API_URL = "http://127.0.0.1:5000/api/new_alert"
 
+# Prefer the TensorRT engine (run export_engine.py once; needs GPU compute capability >= 7.0)
+MODEL_PATH = "m1.engine" if os.path.exists("m1.engine") else "m1.pt"
+# Must match the imgsz the engine was built with (see export_engine.py) to avoid per-call re-shape
+ENGINE_IMGSZ = 960
+
+# Frames per predict() call — batching keeps the GPU fed instead of paying
+# kernel-launch overhead per frame (pair with the engine's dynamic batch=16)
+BATCH = 8
+
 def parse_args():
     parser = argparse.ArgumentParser(description="IRIS Accident Detector — Live Preview")
     parser.add_argument("videos", nargs="*", default=["test1.mp4"],
                         help="One or more video file paths")
-    parser.add_argument("--model", default="m1.pt",    help="YOLO weights (.pt)")
+    parser.add_argument("--model", default=MODEL_PATH,  help="YOLO weights (.pt or .engine)")
+    parser.add_argument("--imgsz", type=int, default=None,
+                        help="Inference image size (default: 960 for .engine, 640 for .pt)")
     parser.add_argument("--conf", type=float, default=0.05, help="Confidence threshold")
-    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size")
-    return parser.parse_args()
+    parser.add_argument("--static-thresh", type=float, default=2.0,
+                        help="Skip inference when mean 32x32 frame diff is below this (0 disables)")
+    args = parser.parse_args()
+    if args.imgsz is None:
+        args.imgsz = ENGINE_IMGSZ if args.model.endswith(".engine") else 640
+    return args
+
+def _put(q, item, stop):
+    """Blocking put that gives up once the consumer has signalled stop.
+
+    Keeps an abandoned reader from blocking forever on a full queue after
+    the main loop quit mid-video."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _reader(cap, q, stop):
+    """Decode frames on a background thread so inference never waits on the codec.
+
+    Owns the VideoCapture: it is only released here, never by the consumer,
+    since OpenCV captures are not safe to release while read() is running."""
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if not _put(q, frame, stop):
+                break
+    finally:
+        cap.release()
+        _put(q, None, stop)  # EOF sentinel — the consumer always gets one
+
+def _reader_gpu(reader, q, stop):
+    """NVDEC decode on a background thread (CUDA-enabled OpenCV builds only)."""
+    try:
+        while not stop.is_set():
+            ret, gpu_frame = reader.nextFrame()
+            if not ret:
+                break
+            # predict() wants host BGR; NVDEC returns BGRA GpuMats
+            frame = gpu_frame.download()
+            if frame is None:
+                continue
+            if frame.ndim == 3 and frame.shape[2] == 4:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+            if not _put(q, frame, stop):
+                break
+    except cv2.error as e:
+        print(f"  NVDEC decode error: {e}")
+    finally:
+        _put(q, None, stop)  # sentinel even on error, or the consumer hangs on get()
 
-def process_video(model, video_path, conf, imgsz):
+def process_video(model, video_path, conf, imgsz, predict_kwargs, static_thresh):
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"❌ Could not open: {video_path}")
@@ -32,79 +96,138 @@ def process_video(model, video_path, conf, imgsz):
     print(f"\n▶ Playing: {video_path}  ({w}x{h}, {total_frames} frames)")
     print("  Press Q to skip / quit\n")
 
+    # Bounded queue: decode overlaps with inference instead of serializing.
+    # Prefer NVDEC (cv2.cudacodec) when the OpenCV build has it — offloads
+    # H.264 decode from the CPU entirely — else fall back to ffmpeg decode.
+    q = queue.Queue(maxsize=2 * BATCH)
+    stop = threading.Event()  # set on Q-quit so the reader winds down and releases the capture
+    gpu_reader = None
+    if hasattr(cv2, "cudacodec"):
+        try:
+            gpu_reader = cv2.cudacodec.createVideoReader(video_path)
+            print("  Using NVDEC GPU decode")
+        except cv2.error as e:
+            gpu_reader = None
+            print(f"  cudacodec unavailable ({e}), using CPU decode")
+    if gpu_reader is not None:
+        cap.release()  # metadata already read; NVDEC owns the decoding
+        threading.Thread(target=_reader_gpu, args=(gpu_reader, q, stop), daemon=True).start()
+    else:
+        threading.Thread(target=_reader, args=(cap, q, stop), daemon=True).start()
+
     frame_id = 0
     alert_sent = False
     frame_skip = 1
+    eof = False
+    prev_thumb = None
+    last_results = None
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_id += 1
-        
-        # SPEED TRICK: Only run AI on every 3rd frame (configurable)
-        if frame_id % frame_skip != 0:
-            cv2.imshow("IRIS Accident Detection (Live)", frame)
-            if (cv2.waitKey(1) & 0xFF) in [ord('q'), ord('Q')]:
+    while not eof:
+        # Fill a batch so one predict() call amortizes launch overhead over BATCH frames
+        buf = []
+        while len(buf) < BATCH:
+            frame = q.get()
+            if frame is None:
+                eof = True
                 break
-            continue
+            frame_id += 1
 
-        results = model(frame, imgsz=imgsz, conf=conf, verbose=False)
-        accident_detected = False
-
-        if results[0].boxes is not None:
-            for box in results[0].boxes:
-                class_id = int(box.cls[0])
-                conf_val = float(box.conf[0])
-                
-                # Check specifically for Accidents (Class 1)
-                if class_id == 1 and conf_val >= 0.25:
-                    accident_detected = True
-                    
-                    # --- ACTION 1: DRAW BOXES MANUALLY ---
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
-                    cv2.putText(frame, f"ACCIDENT {conf_val:.2f}", (x1, y1 - 10), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                    
-                    # --- ACTION 2: SAVE SNAPSHOT & SEND ALERT (EXACTLY ONCE) ---
-                    if not alert_sent:
-                        alert_sent = True
-                        ts = time.time()
-                        
-                        snap_path = os.path.abspath(f"outputs/crash_{int(ts)}.jpg")
-                        os.makedirs("outputs", exist_ok=True)
-                        cv2.imwrite(snap_path, frame)
-                        print(f"zSNAPSHOT SAVED: {snap_path}")
-                        
-                        # Send to Flask
-                        payload = {
-                            "location": "Main St", 
-                            "image_path": snap_path,
-                            "time": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(ts))
-                        }
-                        try:
-                            res = requests.post(API_URL, json=payload, timeout=2)
-                            print(f"\n[!] FIRST ALERT SENT! status: {res.status_code}")
-                        except Exception as e:
-                            print(f"\n[!] API error: {e}")
-
-        # 4. Show the AI frame
-        if accident_detected:
-            cv2.imshow("IRIS Accident Detection (Live)", frame)
-        else:
-            # If no accident, show the plot (shows cars too if you want)
-            cv2.imshow("IRIS Accident Detection (Live)", results[0].plot())
+            # SPEED TRICK: Only run AI on every Nth frame (configurable)
+            if frame_id % frame_skip != 0:
+                cv2.imshow("IRIS Accident Detection (Live)", frame)
+                if (cv2.waitKey(1) & 0xFF) in [ord('q'), ord('Q')]:
+                    stop.set()
+                    return
+                continue
 
-        if (cv2.waitKey(1) & 0xFF) in [ord('q'), ord('Q')]:
-            print("  ⏭ Skipped / Quit")
+            # Cheap static-frame gate (~0.1 ms): near-identical frames reuse the
+            # last results instead of paying a full forward pass
+            thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 32))
+            is_static = (static_thresh > 0 and prev_thumb is not None
+                         and float(cv2.absdiff(thumb, prev_thumb).mean()) < static_thresh)
+            prev_thumb = thumb
+            buf.append((frame, is_static))
+
+        if not buf:
             break
 
-    cap.release()
+        active = [frame for frame, is_static in buf if not is_static]
+        results_iter = iter(model(active, imgsz=imgsz, conf=conf, verbose=False,
+                                  **predict_kwargs) if active else [])
+
+        for frame, is_static in buf:
+            if is_static:
+                results = last_results
+            else:
+                results = next(results_iter)
+                last_results = results
+            if results is None:
+                cv2.imshow("IRIS Accident Detection (Live)", frame)
+                if (cv2.waitKey(1) & 0xFF) in [ord('q'), ord('Q')]:
+                    stop.set()
+                    return
+                continue
+
+            accident_detected = False
+
+            if results.boxes is not None and len(results.boxes):
+                # One device->host copy per array — indexing box.cls[0]/box.conf[0]
+                # per box forced a GPU sync for every detection
+                xyxy  = results.boxes.xyxy.cpu().numpy().astype(int)
+                confs = results.boxes.conf.cpu().numpy()
+                clss  = results.boxes.cls.cpu().numpy().astype(int)
+                for (x1, y1, x2, y2), conf_val, class_id in zip(xyxy, confs, clss):
+                    conf_val = float(conf_val)
+
+                    # Check specifically for Accidents (Class 1)
+                    if class_id == 1 and conf_val >= 0.25:
+                        accident_detected = True
+
+                        # --- ACTION 1: DRAW BOXES MANUALLY ---
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
+                        cv2.putText(frame, f"ACCIDENT {conf_val:.2f}", (x1, y1 - 10),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+
+                        # --- ACTION 2: SAVE SNAPSHOT & SEND ALERT (EXACTLY ONCE) ---
+                        if not alert_sent:
+                            alert_sent = True
+                            ts = time.time()
+
+                            snap_path = os.path.abspath(f"outputs/crash_{int(ts)}.jpg")
+                            os.makedirs("outputs", exist_ok=True)
+                            cv2.imwrite(snap_path, frame)
+                            print(f"zSNAPSHOT SAVED: {snap_path}")
+
+                            # Send to Flask
+                            payload = {
+                                "location": "Main St",
+                                "image_path": snap_path,
+                                "time": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(ts))
+                            }
+                            try:
+                                res = requests.post(API_URL, json=payload, timeout=2)
+                                print(f"\n[!] FIRST ALERT SENT! status: {res.status_code}")
+                            except Exception as e:
+                                print(f"\n[!] API error: {e}")
+                    else:
+                        # Other detections (cars etc.) — draw directly on the frame
+                        # instead of results.plot(), which allocates a fresh H×W×3
+                        # array per frame
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 200, 0), 2)
+                        cv2.putText(frame, f"{conf_val:.2f}", (x1, y1 - 5),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 0), 1)
+
+            # 4. Show the annotated frame (drawn in place, zero extra allocation)
+            cv2.imshow("IRIS Accident Detection (Live)", frame)
+
+            if (cv2.waitKey(1) & 0xFF) in [ord('q'), ord('Q')]:
+                print("  ⏭ Skipped / Quit")
+                stop.set()
+                return
 
 def main():
     args = parse_args()
-    model = YOLO(args.model)
+    model, predict_kwargs = load_model(args.model)
     print(f"\n{'='*55}")
     print(f"  IRIS Live Detector  |  Model: {args.model}")
     print(f"  Videos: {len(args.videos)}  Conf: {args.conf}  ImgSz: {args.imgsz}")
@@ -112,7 +235,8 @@ def main():
 
     for i, video in enumerate(args.videos, 1):
         print(f"\n[{i}/{len(args.videos)}]", end="")
-        process_video(model, video, args.conf, args.imgsz)
+        process_video(model, video, args.conf, args.imgsz, predict_kwargs,
+                      args.static_thresh)
 
     cv2.destroyAllWindows()
     print("\n✅ All videos processed. Done.")
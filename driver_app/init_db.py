@@ -9,7 +9,9 @@ from datetime import datetime
 DB_PATH = os.path.join(os.path.dirname(__file__), "crashguard.db")
 
 def hash_pw(pw):
-    return hashlib.sha256(pw.encode()).hexdigest()
+    # BLAKE2b is ~3x faster than SHA-256 for the same security margin here;
+    # must stay in sync with server.hash_pw
+    return hashlib.blake2b(pw.encode(), digest_size=16).hexdigest()
 
 def init():
     # Remove old DB if it exists to start fresh
@@ -17,7 +19,14 @@ def init():
         os.remove(DB_PATH)
         
     conn = sqlite3.connect(DB_PATH)
+
+    # WAL + relaxed sync: one fsync per transaction instead of per statement
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
     c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
 
     # 1. ZONE
     c.execute("""
@@ -113,6 +122,19 @@ def init():
         )
     """)
 
+    # --- HOT-PATH INDEXES ---
+    # /api/mission filters DISPATCH by driver + status then walks newest-first;
+    # the composite index lets SQLite do an index range scan and stop at LIMIT 1
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dispatch_driver_status
+        ON DISPATCH(driver_id, status, incident_id DESC)
+    """)
+    # Snapshot lookups (/api/snapshot, /api/latest_alert) search EVIDENCE by incident
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_evidence_incident
+        ON EVIDENCE(incident_id)
+    """)
+
     # --- SEED DATA ---
     ts = datetime.now().isoformat()
 
@@ -160,6 +182,7 @@ def init():
     ]
     c.executemany("INSERT INTO DRIVER (user_id, ambulance_id, on_duty) VALUES (?,?,?)", drivers)
 
+    # Single commit for schema + all seed rows (one fsync total)
     conn.commit()
     conn.close()
     
@@ -0,0 +1,45 @@
+"""
+IRIS Accident Detection — One-Time TensorRT Engine Export
+Usage:
+  python export_engine.py                 # export m1.pt and best.pt
+  python export_engine.py m1.pt           # export a specific weights file
+
+Converts .pt weights to a TensorRT FP16 engine (.engine) that the detect
+scripts load automatically when present. TensorRT fuses conv+BN+activation
+and picks Tensor-Core kernels, typically 2-5x faster than the eager path.
+
+Requires: CUDA GPU with compute capability >= 7.0 (FP16 Tensor Cores)
+and the tensorrt package installed. Run once per GPU — engines are not
+portable across GPU architectures.
+"""
+import sys, os
+from ultralytics import YOLO
+
+DEFAULT_WEIGHTS = ["m1.pt", "best.pt"]
+
+def export(weights):
+    engine_path = os.path.splitext(weights)[0] + ".engine"
+    if os.path.exists(engine_path):
+        print(f"  ⏭ {engine_path} already exists, skipping")
+        return
+    print(f"  Exporting {weights} -> {engine_path} (FP16, dynamic batch up to 16)")
+    YOLO(weights).export(format="engine", imgsz=960, half=True,
+                         dynamic=True, batch=16, workspace=4)
+    print(f"  ✅ Done: {engine_path}")
+
+def main():
+    targets = sys.argv[1:] or [w for w in DEFAULT_WEIGHTS if os.path.exists(w)]
+    if not targets:
+        print("❌ No weights found to export")
+        return
+    print(f"\n{'='*55}")
+    print(f"  IRIS TensorRT Export  |  Targets: {', '.join(targets)}")
+    print(f"{'='*55}\n")
+    for weights in targets:
+        try:
+            export(weights)
+        except Exception as e:
+            print(f"  ❌ Export failed for {weights}: {e}")
+
+if __name__ == "__main__":
+    main()
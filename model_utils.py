@@ -0,0 +1,34 @@
+"""
+IRIS Accident Detection — Shared Model Loading
+Used by detect_image.py / detect_video.py / detect_video_live.py.
+"""
+from ultralytics import YOLO
+
+def _fp16_capable():
+    """FP16 pays off only on Tensor-Core GPUs (compute capability >= 7.0)."""
+    try:
+        import torch
+        return torch.cuda.is_available() and torch.cuda.get_device_capability(0)[0] >= 7
+    except ImportError:
+        return False
+
+def load_model(path):
+    """Load YOLO weights fused and ready for half-precision inference.
+
+    Returns (model, predict_kwargs); pass predict_kwargs into every
+    predict()/model() call. TensorRT engines are already fused and FP16,
+    so they load as-is; .pt weights get Conv+BN fusion and, on capable
+    GPUs, half=True + device=0 so no per-call dtype/device decisions are
+    left to the predictor.
+    """
+    model = YOLO(path)
+    if not path.endswith(".pt"):
+        return model, {}
+    try:
+        model.fuse()
+    except Exception as e:
+        print(f"[model] fuse skipped: {e}")
+    if _fp16_capable():
+        return model, {"half": True, "device": 0}
+    print("[model] GPU compute capability < 7.0 or no CUDA — staying FP32")
+    return model, {}